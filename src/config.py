@@ -1,13 +1,17 @@
 import os
+import functools
+from dataclasses import dataclass, field
+from typing import Dict
 from dotenv import load_dotenv
 
-load_dotenv
+load_dotenv()
 
+@dataclass(frozen=True)
 class Config:
-    
-    BASE_URL = "https://twtransfer.energytransfer.com/ipost/capacity/operationally-available"
 
-    URL_PARAMS = {
+    BASE_URL: str = "https://twtransfer.energytransfer.com/ipost/capacity/operationally-available"
+
+    URL_PARAMS: Dict[str, str] = field(default_factory=lambda: {
 
         "f": "csv",
         "extension": "csv",
@@ -17,27 +21,38 @@ class Config:
         "locType": "ALL",
         "locZone": "ALL"
 
-    }
+    })
 
     # Database configuration
-    DB_HOST = os.getenv("DB_HOST", "localhost")
-    DB_PORT = os.getenv("DB_PORT", "5432")
-    DB_NAME = os.getenv("DB_NAME", "gas_shipments")
-    DB_USER = os.getenv("DB_USER", "postgres")
-    DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
+    DB_HOST: str = field(default_factory=lambda: os.getenv("DB_HOST", "localhost"))
+    DB_PORT: str = field(default_factory=lambda: os.getenv("DB_PORT", "5432"))
+    DB_NAME: str = field(default_factory=lambda: os.getenv("DB_NAME", "gas_shipments"))
+    DB_USER: str = field(default_factory=lambda: os.getenv("DB_USER", "postgres"))
+    DB_PASSWORD: str = field(default_factory=lambda: os.getenv("DB_PASSWORD", "postgres"))
 
     # Request timeout in seconds
-    REQUEST_TIMEOUT = 30
-    
+    REQUEST_TIMEOUT: int = 30
+
     # Maximum retries for HTTP requests
-    MAX_RETRIES = 3
-    
+    MAX_RETRIES: int = 3
+
     # Retry delay in seconds
-    RETRY_DELAY = 5
+    RETRY_DELAY: int = 5
+
+    # Number of CSV files downloaded at the same time
+    DOWNLOAD_WORKERS: int = 8
 
     # Temporary folder for storing downloaded CSV files
-    TEMP_FOLDER = os.getenv("TEMP_FOLDER", "temp_csv")
-    
-    
+    TEMP_FOLDER: str = field(default_factory=lambda: os.getenv("TEMP_FOLDER", "temp_csv"))
+
+
     # Whether to keep temporary CSV files after processing
-    KEEP_TEMP_FILES = os.getenv("KEEP_TEMP_FILES", "True").lower() in ("true", "1", "t")
+    KEEP_TEMP_FILES: bool = field(
+        default_factory=lambda: os.getenv("KEEP_TEMP_FILES", "True").lower() in ("true", "1", "t")
+    )
+
+    @classmethod
+    @functools.lru_cache(maxsize=1)
+    def load(cls) -> "Config":
+        # Build the configuration once, later calls return the same instance
+        return cls()
@@ -1,14 +1,122 @@
+import functools
 import logging
-import psycopg2
-from psycopg2 import sql
-from psycopg2.extras import execute_values
-from typing import List, Dict, Any, Optional, Tuple
+import psycopg
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from operator import itemgetter
+from psycopg_pool import ConnectionPool
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+__all__ = ["Database"]
 
 logger = logging.getLogger(__name__)
 
+# Postgres type of each gas_shipments column, used to cast array parameters
+COLUMN_TYPES = {
+    "loc": "text",
+    "loc_zone": "text",
+    "loc_name": "text",
+    "loc_purpose": "text",
+    "measure_basis": "text",
+    "oper_capacity": "numeric",
+    "design_capacity": "numeric",
+    "scheduled_qty": "numeric",
+    "operationally_available": "numeric",
+    "total_scheduled": "numeric",
+    "gas_day": "date",
+    "cycle": "integer",
+}
+
+# Columns every record carries, in the order values are sent to Postgres
+COLUMNS = tuple(COLUMN_TYPES)
+
+# Reads the values of a record in COLUMNS order as a tuple
+_get_row = itemgetter(*COLUMNS)
+
+# Reads the (loc, gas_day, cycle) key of a row of values in COLUMNS order
+_get_key = itemgetter(COLUMNS.index("loc"), COLUMNS.index("gas_day"), COLUMNS.index("cycle"))
+
+# Non-unique indexes on gas_shipments. Rows arrive in gas_day order, so a BRIN
+# index stays small, and loc is only looked up by equality, which a hash index
+# covers. The UNIQUE (loc, gas_day, cycle) index is part of the table itself
+INDEXES = {
+    "idx_gas_shipments_gas_day_brin": "ON gas_shipments USING BRIN (gas_day) WITH (pages_per_range = 32)",
+    "idx_gas_shipments_loc_hash": "ON gas_shipments USING HASH (loc)",
+}
+
+# B-tree indexes created by earlier versions, dropped when the schema is
+# initialized
+LEGACY_INDEXES = ("idx_gas_shipments_gas_day", "idx_gas_shipments_loc")
+
+# Below this many records duplicates are removed in Python, above it the
+# insert query keeps the last row for each key with DISTINCT ON
+SERVER_DEDUP_THRESHOLD = 1000
+
+def _iter_rows(records):
+    """
+    Iterate over the values of each record as a tuple in COLUMNS order.
+    Records can be a dict with one list of values per column, as the parser
+    returns them, or any iterable of record dicts.
+    """
+    if isinstance(records, dict):
+        missing = [column for column in COLUMNS if column not in records]
+        if missing:
+            raise ValueError(f"Records are missing columns: {', '.join(missing)}")
+        
+        # Read the columns side by side, one row at a time
+        return zip(*(records[column] for column in COLUMNS))
+    
+    return map(_get_row, records)
+
+def _to_columnar(rows):
+    """
+    Turn a list of rows in COLUMNS order into one list of values per column.
+    """
+    return list(map(list, zip(*rows)))
+
+@functools.lru_cache(maxsize=None)
+def _build_upsert_query(columns):
+    """
+    Build the UPSERT that inserts one array parameter per column, keeping the
+    last row for each (loc, gas_day, cycle) key. The query is built once for
+    each tuple of columns.
+    """
+    column_names = ", ".join([f'"{col}"' for col in columns])
+    arrays = ", ".join([f"%s::{COLUMN_TYPES[col]}[]" for col in columns])
+    
+    return f"""
+        INSERT INTO gas_shipments ({column_names})
+        SELECT DISTINCT ON (loc, gas_day, cycle) {column_names}
+        FROM unnest({arrays}) WITH ORDINALITY AS t({column_names}, n)
+        ORDER BY loc, gas_day, cycle, n DESC
+        ON CONFLICT (loc, gas_day, cycle) DO UPDATE
+        SET
+            loc_zone = EXCLUDED.loc_zone,
+            loc_name = EXCLUDED.loc_name,
+            loc_purpose = EXCLUDED.loc_purpose,
+            measure_basis = EXCLUDED.measure_basis,
+            oper_capacity = EXCLUDED.oper_capacity,
+            design_capacity = EXCLUDED.design_capacity,
+            scheduled_qty = EXCLUDED.scheduled_qty,
+            operationally_available = EXCLUDED.operationally_available,
+            total_scheduled = EXCLUDED.total_scheduled,
+            created_at = CURRENT_TIMESTAMP
+    """
+
+def _batches(records, size):
+    """
+    Yield lists of up to size records from any iterable of records.
+    """
+    iterator = iter(records)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
 class Database:
     
-    def __init__(self, host, port, database, user, password):
+    def __init__(self, host, port, database, user, password, min_size=2, max_size=8):
        
         # Save connection parameters
         self.host = host
@@ -16,35 +124,39 @@ class Database:
         self.database = database
         self.user = user
         self.password = password
-        self.conn = None
+        
+        # Pool size, connections are kept open and shared between callers
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None
         
         self.connect()
     
     def connect(self):
         try:
             # Try to connect to the database
-            self.conn = psycopg2.connect(
+            temp_conn = psycopg.connect(
                 host=self.host,
                 port=self.port,
-                database=self.database,
+                dbname=self.database,
                 user=self.user,
                 password=self.password
             )
-            logger.info("Connected to the database")
-        except psycopg2.OperationalError as e:
+            temp_conn.close()
+        except psycopg.OperationalError as e:
             if "database" in str(e) and "does not exist" in str(e):
                 logger.warning(f"Database '{self.database}' does not exist. Attempting to create it...")
                 
                 try:
                     # Connect to the default 'postgres' database to create our database
-                    temp_conn = psycopg2.connect(
+                    temp_conn = psycopg.connect(
                         host=self.host,
                         port=self.port,
-                        database="postgres",  
+                        dbname="postgres",  
                         user=self.user,
-                        password=self.password
+                        password=self.password,
+                        autocommit=True
                     )
-                    temp_conn.autocommit = True  
                     
                     with temp_conn.cursor() as cursor:
                         cursor.execute(f"CREATE DATABASE {self.database}")
@@ -53,16 +165,6 @@ class Database:
                     
                     logger.info(f"Successfully created database '{self.database}'")
                     
-                    # Now connect to the newly created database
-                    self.conn = psycopg2.connect(
-                        host=self.host,
-                        port=self.port,
-                        database=self.database,
-                        user=self.user,
-                        password=self.password
-                    )
-                    logger.info("Connected to the newly created database")
-                    
                 except Exception as create_error:
                     logger.error(f"Failed to create database: {str(create_error)}")
                     raise
@@ -72,51 +174,98 @@ class Database:
         except Exception as e:
             logger.error(f"Error connecting to the database: {str(e)}")
             raise
+        
+        try:
+            # Open the connection pool and wait for the first connections
+            self.pool = ConnectionPool(
+                kwargs={
+                    "host": self.host,
+                    "port": self.port,
+                    "dbname": self.database,
+                    "user": self.user,
+                    "password": self.password,
+                    "prepare_threshold": 1
+                },
+                min_size=min(self.min_size, self.max_size),
+                max_size=self.max_size,
+                configure=self._configure_connection,
+                open=False
+            )
+            self.pool.open(wait=True)
+            logger.info("Connected to the database")
+        except Exception as e:
+            logger.error(f"Error connecting to the database: {str(e)}")
+            raise
+    
+    def _configure_connection(self, conn):
+        # Each pooled connection stages its COPY data in its own temporary
+        # table, so concurrent ingests never share staged rows. Temporary
+        # tables write no WAL and the rows are dropped when a transaction ends
+        stage_columns = ", ".join([f'"{col}" {COLUMN_TYPES[col]}' for col in COLUMN_TYPES])
+        conn.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS gas_shipments_staging ({stage_columns}) "
+            "ON COMMIT DELETE ROWS;"
+        )
+        conn.commit()
     
     def close(self):
-        # Check if connection exists
-        if self.conn:
-            self.conn.close()
+        # Check if the pool exists
+        if self.pool:
+            self.pool.close()
             logger.info("Database connection closed")
     
     def initialize_database(self):
         try:
-            cursor = self.conn.cursor()
-            
-            # SQL to create the table
-            create_table_sql = """
-                CREATE TABLE IF NOT EXISTS gas_shipments (
-                    id SERIAL PRIMARY KEY,
-                    loc TEXT NOT NULL,
-                    loc_zone TEXT,
-                    loc_name TEXT,
-                    loc_purpose TEXT,
-                    measure_basis TEXT,
-                    oper_capacity NUMERIC,
-                    design_capacity NUMERIC,
-                    scheduled_qty NUMERIC,
-                    operationally_available NUMERIC,
-                    total_scheduled NUMERIC,
-                    gas_day DATE NOT NULL,
-                    cycle INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(loc, gas_day, cycle)
-                );
-            """
-            
-            cursor.execute(create_table_sql)
-            
-            # Create indexes for better performance
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_gas_shipments_gas_day ON gas_shipments(gas_day);")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_gas_shipments_loc ON gas_shipments(loc);")
-            
-            self.conn.commit()
-            
-            cursor.close()
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                # Skip the DDL when gas_shipments and its indexes exist and
+                # none of the indexes of earlier versions remain
+                cursor.execute(
+                    """
+                    SELECT
+                        NOT EXISTS (SELECT FROM unnest(%s::text[]) AS name WHERE to_regclass(name) IS NULL)
+                        AND NOT EXISTS (SELECT FROM unnest(%s::text[]) AS name WHERE to_regclass(name) IS NOT NULL)
+                    """,
+                    (["gas_shipments", *INDEXES], list(LEGACY_INDEXES))
+                )
+                if cursor.fetchone()[0]:
+                    logger.info("Database schema is up to date")
+                    return
+                
+                # SQL to create the table
+                create_table_sql = """
+                    CREATE TABLE IF NOT EXISTS gas_shipments (
+                        id SERIAL PRIMARY KEY,
+                        loc TEXT NOT NULL,
+                        loc_zone TEXT,
+                        loc_name TEXT,
+                        loc_purpose TEXT,
+                        measure_basis TEXT,
+                        oper_capacity NUMERIC,
+                        design_capacity NUMERIC,
+                        scheduled_qty NUMERIC,
+                        operationally_available NUMERIC,
+                        total_scheduled NUMERIC,
+                        gas_day DATE NOT NULL,
+                        cycle INTEGER NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(loc, gas_day, cycle)
+                    );
+                """
+                
+                cursor.execute(create_table_sql)
+                
+                # Replace the B-tree indexes created by earlier versions
+                for name in LEGACY_INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {name};")
+                
+                # Create indexes for better performance
+                for name, definition in INDEXES.items():
+                    cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} {definition};")
+                
+                conn.commit()
             
             logger.info("Database initialized successfully")
         except Exception as e:
-            self.conn.rollback()
             logger.error(f"Error initializing database: {str(e)}")
             raise
     
@@ -124,161 +273,255 @@ class Database:
         if not records:
             return []
         
-        unique_records = {}
+        # Map each key to the index of its last record
+        last_index = {}
         
         # Loop through all records
-        for record in records:
+        for i, record in enumerate(records):
             
             key = (record['loc'], record['gas_day'], record['cycle'])     
-            unique_records[key] = record
+            last_index[key] = i
+        
+        # Nothing to drop, return the list as is
+        if len(last_index) == len(records):
+            logger.info("Found 0 duplicate records")
+            return records
         
-        # Convert the dictionary values back to a list
-        deduplicated = list(unique_records.values())
+        # Build the list from the kept indexes
+        deduplicated = [records[i] for i in last_index.values()]
         
         logger.info(f"Found {len(records) - len(deduplicated)} duplicate records")
         
         return deduplicated
     
     def insert_records(self, records):
-       
+        """
+        Insert records with COPY through the staging table. Records can be a
+        list of record dicts or a dict with one list of values per column.
+        """
         if not records:
             logger.warning("No records to insert")
             return 0
         
+        return self.ingest(records)
+    
+    def insert_in_small_groups(self, records, group_size=100):
+        """
+        Insert records in groups of group_size, sending each group as one
+        list of values per column with executemany on a single cursor. All
+        the groups run in one transaction with synchronous_commit off and are
+        committed once at the end, so a failing group rolls back every group.
+        Records can be a dict with one list of values per column or any
+        iterable of record dicts, and are read one group at a time. The key
+        of every distinct row is kept to return the number of rows written,
+        so memory still grows with the number of distinct keys in the input.
+        """
+        batches = _batches(_iter_rows(records), group_size)
+        
+        # Check if there are any records
+        first_group = next(batches, None)
+        if first_group is None:
+            logger.warning("No records to insert")
+            return 0
+        
+        # The query text is the same for every group, so it is
+        # prepared on the first group and reused for the rest
+        query = _build_upsert_query(COLUMNS)
+        
+        # Keys of the rows written. A key repeated in several groups is
+        # written by each of them but is still one row in the table
+        written_keys = set()
+        
+        def columnar_groups():
+            # One list of values per column for each group. Duplicates within
+            # a group are dropped by the query, and a later group overwrites
+            # rows written by an earlier one, so the last record for each key wins
+            for group in chain([first_group], batches):
+                written_keys.update(map(_get_key, group))
+                yield _to_columnar(group)
+        
         try:
-            # Remove duplicates before inserting
-            unique_records = self.remove_duplicates(records)
-            
-            if not unique_records:
-                logger.warning("No unique records to insert")
-                return 0
-            
-            cursor = self.conn.cursor()
-            
-            columns = list(unique_records[0].keys())
-            
-            all_values = []
-            for record in unique_records:
-                record_values = []
-                for column in columns:
-                    record_values.append(record.get(column))
-                all_values.append(record_values)
-            
-            # Build the SQL query
-            column_names = ", ".join([f'"{col}"' for col in columns])
-            placeholders = ", ".join(["%s"] * len(columns))
-            
-           
-            query = f"""
-                INSERT INTO gas_shipments ({column_names})
-                VALUES %s
-                ON CONFLICT (loc, gas_day, cycle) DO UPDATE
-                SET
-                    loc_zone = EXCLUDED.loc_zone,
-                    loc_name = EXCLUDED.loc_name,
-                    loc_purpose = EXCLUDED.loc_purpose,
-                    measure_basis = EXCLUDED.measure_basis,
-                    oper_capacity = EXCLUDED.oper_capacity,
-                    design_capacity = EXCLUDED.design_capacity,
-                    scheduled_qty = EXCLUDED.scheduled_qty,
-                    operationally_available = EXCLUDED.operationally_available,
-                    total_scheduled = EXCLUDED.total_scheduled,
-                    created_at = CURRENT_TIMESTAMP
-                RETURNING id
-            """
-            
-            result = execute_values(cursor, query, all_values, fetch=True)
-            
-            self.conn.commit()
-            
-            cursor.close()
+            # executemany sends all the groups on one cursor without waiting
+            # for the server between them
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                # The data can be downloaded again, so skip waiting for the WAL flush
+                cursor.execute("SET LOCAL synchronous_commit = OFF")
+                
+                cursor.executemany(query, columnar_groups())
+                total_inserted = len(written_keys)
+                
+                # Commit all the groups in a single transaction
+                conn.commit()
             
-            # Return the number of inserted records
-            inserted_count = len(result)
-            logger.info(f"Inserted {inserted_count} records into the database")
-            return inserted_count
+            logger.info(f"Inserted {total_inserted} records in groups of {group_size}")
+            return total_inserted
                 
         except Exception as e:
-            self.conn.rollback()
             logger.error(f"Error inserting records: {str(e)}")
             raise
     
-    def insert_in_small_groups(self, records, group_size=100):
+    def insert_in_parallel_groups(self, records, group_size=1000, max_workers=8):
         """
-        Insert records into the database in small groups to avoid errors.
+        Insert records in groups sent at the same time from several threads,
+        each group on its own pooled connection and in its own transaction.
         """
         # Check if there are any records
         if not records:
             logger.warning("No records to insert")
             return 0
         
-        # Remove duplicates first
-        unique_records = self.remove_duplicates(records)
+        # Remove duplicates first, so no two groups touch the same row. The
+        # last row for each key wins
+        rows = list(_iter_rows(records))
+        unique_rows = list({_get_key(row): row for row in rows}.values())
+        logger.info(f"Found {len(rows) - len(unique_rows)} duplicate records")
         
-        if not unique_records:
+        if not unique_rows:
             logger.warning("No unique records to insert")
             return 0
         
-        # Keep track of how many records were inserted
-        total_inserted = 0
+        query = _build_upsert_query(COLUMNS)
+        
+        groups = [unique_rows[i:i+group_size] for i in range(0, len(unique_rows), group_size)]
         
         try:
-            i = 0
-            while i < len(unique_records):
-                # Get a group of records
-                group = unique_records[i:i+group_size]
-                
-                cursor = self.conn.cursor()
-                
-                # Get the column names from the first record
-                columns = list(group[0].keys())
-                
-                # Create a list of values for each record
-                group_values = []
-                for record in group:
-                    record_values = []
-                    for column in columns:
-                        record_values.append(record.get(column))
-                    group_values.append(record_values)
+            # More workers than pooled connections would only wait for a connection
+            with ThreadPoolExecutor(max_workers=min(max_workers, self.max_size)) as executor:
+                group_counts = list(executor.map(
+                    lambda group: self._insert_one_batch(group, query),
+                    groups
+                ))
+            
+            total_inserted = sum(group_counts)
+            logger.info(f"Inserted {total_inserted} records in {len(groups)} groups")
+            return total_inserted
                 
-                column_names = ", ".join([f'"{col}"' for col in columns])
+        except Exception as e:
+            logger.error(f"Error inserting records: {str(e)}")
+            raise
+    
+    def _insert_one_batch(self, group, query):
+        # Each group is committed on its own, so it can be retried safely
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(query, _to_columnar(group), prepare=True)
+            group_inserted = cursor.rowcount
+            
+            conn.commit()
+        
+        return group_inserted
+    
+    def ingest(self, records):
+        """
+        Insert records by streaming them into the staging table with COPY and
+        merging them into gas_shipments with a single UPSERT. Records can be
+        a dict with one list of values per column, as the parser returns
+        them, or any iterable of record dicts, which is never held in a list.
+        """
+        rows = self._prepare_rows(records)
+        if rows is None:
+            return 0
+        
+        return self._ingest_rows(COLUMNS, rows)
+    
+    def _prepare_rows(self, records) -> Optional[Iterator[Tuple]]:
+        # Rows of values in COLUMNS order for ingest and bulk_load, or None
+        # when there are no records
+        
+        # Small lists are deduplicated here, anything else by the server
+        if isinstance(records, list) and len(records) < SERVER_DEDUP_THRESHOLD:
+            records = self.remove_duplicates(records)
+        rows = _iter_rows(records)
+        
+        # Check if there are any records
+        first_row = next(rows, None)
+        if first_row is None:
+            logger.warning("No records to insert")
+            return None
+        
+        return chain([first_row], rows)
+    
+    def _ingest_rows(self, columns, rows):
+        # Stage and merge rows of values given in the order of columns
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                inserted_count = self._stage_and_merge(cursor, columns, rows)
                 
-                # Insert the group
-                query = f"""
-                    INSERT INTO gas_shipments ({column_names})
-                    VALUES %s
-                    ON CONFLICT (loc, gas_day, cycle) DO UPDATE
-                    SET
-                        loc_zone = EXCLUDED.loc_zone,
-                        loc_name = EXCLUDED.loc_name,
-                        loc_purpose = EXCLUDED.loc_purpose,
-                        measure_basis = EXCLUDED.measure_basis,
-                        oper_capacity = EXCLUDED.oper_capacity,
-                        design_capacity = EXCLUDED.design_capacity,
-                        scheduled_qty = EXCLUDED.scheduled_qty,
-                        operationally_available = EXCLUDED.operationally_available,
-                        total_scheduled = EXCLUDED.total_scheduled,
-                        created_at = CURRENT_TIMESTAMP
-                    RETURNING id
-                """
+                conn.commit()
+            
+            logger.info(f"Inserted {inserted_count} records into the database")
+            return inserted_count
                 
-                result = execute_values(cursor, query, group_values, fetch=True)
+        except Exception as e:
+            logger.error(f"Error inserting records: {str(e)}")
+            raise
+    
+    def bulk_load(self, records):
+        """
+        Load a large batch of records like ingest, but drop the non-unique
+        indexes first and rebuild them once all the rows are in. Records take
+        the same shapes as in ingest.
+        """
+        rows = self._prepare_rows(records)
+        if rows is None:
+            return 0
+        
+        try:
+            with self.pool.connection() as conn, conn.cursor() as cursor:
+                # Give the index rebuild more memory than the default
+                cursor.execute("SET LOCAL maintenance_work_mem = '1GB';")
                 
-                self.conn.commit()
+                # The unique index stays, ON CONFLICT needs it
+                for name in INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {name};")
                 
-                cursor.close()
+                inserted_count = self._stage_and_merge(cursor, COLUMNS, rows)
                 
-                # Update the total count
-                group_inserted = len(result)
-                total_inserted += group_inserted
-                logger.info(f"Inserted group of {group_inserted} records (total: {total_inserted})")
+                # Rebuild the indexes in one pass and refresh the statistics
+                for name, definition in INDEXES.items():
+                    cursor.execute(f"CREATE INDEX {name} {definition};")
+                cursor.execute("ANALYZE gas_shipments;")
                 
-                i += group_size
+                conn.commit()
             
-            return total_inserted
+            logger.info(f"Bulk loaded {inserted_count} records into the database")
+            return inserted_count
                 
         except Exception as e:
-            self.conn.rollback()
-            logger.error(f"Error inserting records: {str(e)}")
+            logger.error(f"Error bulk loading records: {str(e)}")
             raise
-
+    
+    def _stage_and_merge(self, cursor, columns, rows):
+        # COPY the rows into the staging table and merge them into
+        # gas_shipments, returning the number of rows written
+        column_names = ", ".join([f'"{col}"' for col in columns])
+        
+        # Stream the records into the staging table in text format, so the
+        # server parses each value into the column type. Dates and ISO date
+        # strings, floats and Decimals are all loaded as they are
+        with cursor.copy(f"COPY gas_shipments_staging ({column_names}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+        
+        # Merge the staged rows, the last row for each key wins
+        query = f"""
+            INSERT INTO gas_shipments ({column_names})
+            SELECT DISTINCT ON (loc, gas_day, cycle) {column_names}
+            FROM gas_shipments_staging
+            ORDER BY loc, gas_day, cycle, ctid DESC
+            ON CONFLICT (loc, gas_day, cycle) DO UPDATE
+            SET
+                loc_zone = EXCLUDED.loc_zone,
+                loc_name = EXCLUDED.loc_name,
+                loc_purpose = EXCLUDED.loc_purpose,
+                measure_basis = EXCLUDED.measure_basis,
+                oper_capacity = EXCLUDED.oper_capacity,
+                design_capacity = EXCLUDED.design_capacity,
+                scheduled_qty = EXCLUDED.scheduled_qty,
+                operationally_available = EXCLUDED.operationally_available,
+                total_scheduled = EXCLUDED.total_scheduled,
+                created_at = CURRENT_TIMESTAMP
+        """
+        
+        # The staging table is emptied when the caller commits
+        cursor.execute(query)
+        return cursor.rowcount
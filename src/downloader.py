@@ -1,97 +1,111 @@
 import os
-import time
 import logging
 import requests
-from typing import Optional, Tuple
-from urllib.parse import quote
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+from typing import Optional
+from urllib.parse import quote, urlencode
 
 from config import Config
 
 logger = logging.getLogger(__name__)
 
 class CSVDownloader:    
-    def __init__(self):
-        self.config = Config()
+    def __init__(self, config: Optional[Config] = None):
+        # Use the shared configuration unless one is passed in
+        self.config = config or Config.load()
         self.session = requests.Session()
         
+        # Retry failed requests with exponential backoff, honouring Retry-After.
+        # MAX_RETRIES counts every attempt, the first one included
+        retry = Retry(
+            total=max(self.config.MAX_RETRIES - 1, 0),
+            backoff_factor=self.config.RETRY_DELAY,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        
+        # Keep one pooled connection per download worker
+        adapter = HTTPAdapter(max_retries=retry, pool_maxsize=self.config.DOWNLOAD_WORKERS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        
+        # Encode the static query parameters once, only the gas day and
+        # cycle change between requests
+        static_params = {
+            k: v for k, v in self.config.URL_PARAMS.items() if k not in ("gasDay", "cycle")
+        }
+        self._url_template = (
+            f"{self.config.BASE_URL}?{urlencode(static_params)}"
+            "&gasDay={gas_day}&cycle={cycle}"
+        )
+        
         # Create temporary folder if it doesn't exist
         os.makedirs(self.config.TEMP_FOLDER, exist_ok=True)
-        logger.info(f"Temporary folder for CSV files: {self.config.TEMP_FOLDER}")
+        logger.info("Temporary folder for CSV files: %s", self.config.TEMP_FOLDER)
     
     def build_url(self, gas_day: str, cycle: int) -> str:
       
-        params = self.config.URL_PARAMS.copy()
-        
-        params["gasDay"] = quote(gas_day)
-        params["cycle"] = str(cycle)
-        
-        query_string = "&".join([f"{k}={v}" for k, v in params.items()])
-        
-        return f"{self.config.BASE_URL}?{query_string}"
+        return self._url_template.format(gas_day=quote(gas_day), cycle=cycle)
     
-    def get_temp_file_path(self, gas_day: str, cycle: int) -> str:
+    def get_temp_file_path(self, iso_date: str, cycle: int) -> str:
        
-        # Convert gas_day from MM/DD/YYYY to YYYY-MM-DD for the filename
-        parts = gas_day.split('/')
-        if len(parts) == 3:
-            formatted_date = f"{parts[2]}-{parts[0]}-{parts[1]}"
-        else:
-            formatted_date = gas_day.replace('/', '-')
-        
-        return os.path.join(self.config.TEMP_FOLDER, f"gas_data_{formatted_date}_cycle_{cycle}.csv")
+        # Files are named by the YYYY-MM-DD form of the gas day
+        return os.path.join(self.config.TEMP_FOLDER, f"gas_data_{iso_date}_cycle_{cycle}.csv")
     
-    def download_csv(self, gas_day: str, cycle: int) -> Tuple[Optional[str], Optional[str]]:
+    def download_csv(self, gas_day: str, cycle: int, iso_date: str) -> Optional[str]:
        
         url = self.build_url(gas_day, cycle)
-        temp_file_path = self.get_temp_file_path(gas_day, cycle)
+        temp_file_path = self.get_temp_file_path(iso_date, cycle)
         
         # Check if the file already exists
         if os.path.exists(temp_file_path):
-            logger.info(f"CSV file already exists at: {temp_file_path}")
-            with open(temp_file_path, 'r', encoding='utf-8') as file:
-                return file.read(), temp_file_path
+            logger.debug("CSV file already exists at: %s", temp_file_path)
+            return temp_file_path
         
-        logger.info(f"Downloading CSV from: {url}")
+        logger.debug("Downloading CSV from: %s", url)
         
-        for attempt in range(1, self.config.MAX_RETRIES + 1):
-            try:
-                response = self.session.get(
-                    url, 
-                    timeout=self.config.REQUEST_TIMEOUT
-                )
-                
+        try:
+            with self.session.get(url, timeout=self.config.REQUEST_TIMEOUT, stream=True) as response:
                 # Check if the request was successful
                 if response.status_code == 200:
                     content_type = response.headers.get('Content-Type', '')
                     if 'text/csv' in content_type or 'application/csv' in content_type:
-                        # Save CSV to file
-                        with open(temp_file_path, 'w', encoding='utf-8') as file:
-                            file.write(response.text)
-                        logger.info(f"Saved CSV to: {temp_file_path}")
-                        return response.text, temp_file_path
+                        # Stream the CSV to a partial file and rename it once
+                        # complete, so an interrupted download is never reused
+                        partial_path = f"{temp_file_path}.part"
+                        try:
+                            with open(partial_path, 'wb') as file:
+                                for chunk in response.iter_content(chunk_size=64 * 1024):
+                                    file.write(chunk)
+                            os.replace(partial_path, temp_file_path)
+                        except Exception:
+                            # Don't leave the unfinished file behind
+                            if os.path.exists(partial_path):
+                                os.remove(partial_path)
+                            raise
+                        logger.info("Saved CSV to: %s", temp_file_path)
+                        return temp_file_path
                     elif 'text/html' in content_type and 'No data found' in response.text:
-                        logger.warning(f"No data found for gas day: {gas_day}, cycle: {cycle}")
-                        return None, None
+                        logger.warning("No data found for gas day: %s, cycle: %s", gas_day, cycle)
+                        return None
                     else:
                         logger.warning(
-                            f"Unexpected content type: {content_type} for gas day: {gas_day}, cycle: {cycle}"
+                            "Unexpected content type: %s for gas day: %s, cycle: %s",
+                            content_type, gas_day, cycle
                         )
-                        return None, None
-                else:
-                    logger.warning(
-                        f"Failed to download CSV (attempt {attempt}/{self.config.MAX_RETRIES}): "
-                        f"Status code {response.status_code}"
-                    )
-            except requests.RequestException as e:
-                logger.warning(
-                    f"Request exception (attempt {attempt}/{self.config.MAX_RETRIES}): {str(e)}"
+                        return None
+                
+                logger.error(
+                    "Failed to download CSV for gas day: %s, cycle: %s: Status code %d",
+                    gas_day, cycle, response.status_code
                 )
-            
-            if attempt < self.config.MAX_RETRIES:
-                time.sleep(self.config.RETRY_DELAY)
-        
-        logger.error(f"Failed to download CSV after {self.config.MAX_RETRIES} attempts")
-        return None, None
+                return None
+        except requests.RequestException as e:
+            logger.error("Failed to download CSV for gas day: %s, cycle: %s: %s", gas_day, cycle, e)
+            return None
     
     def cleanup(self, file_path: str = None):
       
@@ -99,16 +113,16 @@ class CSVDownloader:
             if file_path and os.path.exists(file_path):
                 try:
                     os.remove(file_path)
-                    logger.info(f"Deleted temporary file: {file_path}")
+                    logger.info("Deleted temporary file: %s", file_path)
                 except Exception as e:
-                    logger.warning(f"Failed to delete temporary file {file_path}: {str(e)}")
+                    logger.warning("Failed to delete temporary file %s: %s", file_path, e)
             elif file_path is None:
                 try:
                     for filename in os.listdir(self.config.TEMP_FOLDER):
                         file_path = os.path.join(self.config.TEMP_FOLDER, filename)
                         if os.path.isfile(file_path):
                             os.remove(file_path)
-                    logger.info(f"Cleaned up all files in {self.config.TEMP_FOLDER}")
+                    logger.info("Cleaned up all files in %s", self.config.TEMP_FOLDER)
                 except Exception as e:
-                    logger.warning(f"Failed to clean up temporary folder: {str(e)}")
+                    logger.warning("Failed to clean up temporary folder: %s", e)
 
@@ -2,6 +2,7 @@ import os
 import logging
 import datetime
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tabulate import tabulate
 from tqdm import tqdm
 
@@ -79,7 +80,7 @@ def show_data_summary(records):
     print("\n" + "="*80)
     print("DATA SUMMARY")
     print("="*80)
-    print(f"Total records to be inserted: {len(records)}")
+    print(f"Total records to be inserted: {len(df)}")
     print(f"Date range: {df['gas_day'].min()} to {df['gas_day'].max()}")
     print(f"Number of unique locations: {df['loc'].nunique()}")
     print("\nRecords by date and cycle:")
@@ -104,76 +105,100 @@ def ask_user_to_continue():
         else:
             print("Please enter 'yes' or 'no'.")
 
+def process_date_cycle(downloader, parser, config, iso_date, url_date, cycle):
+    """
+    Download and parse the CSV for one date and cycle, returning its records
+    as one list of values per column. The date is given both as YYYY-MM-DD
+    and in the MM/DD/YYYY form the download URL expects.
+    """
+    logger.info("Processing date: %s, cycle: %s", iso_date, cycle)
+    
+    # Download the CSV
+    temp_file_path = downloader.download_csv(
+        gas_day=url_date,
+        cycle=cycle,
+        iso_date=iso_date
+    )
+    
+    if not temp_file_path:
+        logger.warning("No data available for date: %s, cycle: %s", iso_date, cycle)
+        return {}
+    
+    records = parser.parse_csv(temp_file_path, gas_day=iso_date, cycle=cycle)
+    
+    if not records['loc']:
+        logger.warning("No valid records found for date: %s, cycle: %s", iso_date, cycle)
+        return {}
+    
+    if not config.KEEP_TEMP_FILES:
+        downloader.cleanup(temp_file_path)
+    
+    return records
+
 def main():
     logger.info("Starting natural gas shipment data pipeline")
     
     print_pipeline_explanation()
     
     try:
-        config = Config()
+        config = Config.load()
         
-        downloader = CSVDownloader()
+        downloader = CSVDownloader(config)
         parser = CSVParser()
         db = Database(
             host=config.DB_HOST,
             port=config.DB_PORT,
             database=config.DB_NAME,
             user=config.DB_USER,
-            password=config.DB_PASSWORD
+            password=config.DB_PASSWORD,
+            max_size=config.DOWNLOAD_WORKERS
         )
         
         db.initialize_database()
         
         # Get dates for the last 3 days
         dates = get_last_few_days(days=3)
-        logger.info(f"Processing data for dates: {[d.strftime('%Y-%m-%d') for d in dates]}")
         
-        # List to store all records
-        all_records = []
+        # Format every date once, for the records and for the download URL
+        date_strings = [(date.isoformat(), format_date_for_url(date)) for date in dates]
+        logger.info("Processing data for dates: %s", [iso_date for iso_date, _ in date_strings])
         
-        for date in tqdm(dates, desc="Processing dates"):
-            formatted_date = format_date_for_url(date)
+        # Process each cycle (usually 1-5) of every date, downloading
+        # several files at the same time
+        tasks = [
+            (iso_date, url_date, cycle)
+            for iso_date, url_date in date_strings
+            for cycle in range(1, 6)
+        ]
+        results = {}
+        
+        with ThreadPoolExecutor(max_workers=config.DOWNLOAD_WORKERS) as executor:
+            futures = {
+                executor.submit(process_date_cycle, downloader, parser, config, *task): task
+                for task in tasks
+            }
             
-            # Process each cycle (usually 1-5)
-            for cycle in tqdm(range(1, 6), desc=f"Processing cycles for {date.strftime('%Y-%m-%d')}"):
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Processing dates and cycles"):
+                task = futures[future]
                 try:
-                    logger.info(f"Processing date: {date.strftime('%Y-%m-%d')}, cycle: {cycle}")
-                    
-                    # Download the CSV
-                    csv_data, temp_file_path = downloader.download_csv(
-                        gas_day=formatted_date,
-                        cycle=cycle
-                    )
-                    
-                    if not csv_data:
-                        logger.warning(f"No data available for date: {date.strftime('%Y-%m-%d')}, cycle: {cycle}")
-                        continue
-                    
-                    records = parser.parse_csv(csv_data)
-                    
-                    if not records:
-                        logger.warning(f"No valid records found for date: {date.strftime('%Y-%m-%d')}, cycle: {cycle}")
-                        continue
-                    
-                    for record in records:
-                        record['gas_day'] = date.isoformat()
-                        record['cycle'] = cycle
-                    
-                    all_records.extend(records)
-                    
-                    if temp_file_path and not config.KEEP_TEMP_FILES:
-                        downloader.cleanup(temp_file_path)
-                    
+                    results[task] = future.result()
                 except Exception as e:
-                    logger.error(f"Error processing date: {date.strftime('%Y-%m-%d')}, cycle: {cycle}: {str(e)}")
+                    iso_date, _, cycle = task
+                    logger.error("Error processing date: %s, cycle: %s: %s", iso_date, cycle, e)
+        
+        # Columns of all records, in date and cycle order
+        all_records = {}
+        for task in tasks:
+            for column, values in results.get(task, {}).items():
+                all_records.setdefault(column, []).extend(values)
         
         if all_records:
             show_data_summary(all_records)
             
             if ask_user_to_continue():
-                # Insert into database in small groups to avoid errors
-                inserted_count = db.insert_in_small_groups(all_records, group_size=100)
-                logger.info(f"Inserted {inserted_count} records into the database")
+                # Stream the records into the database with COPY
+                inserted_count = db.ingest(all_records)
+                logger.info("Inserted %d records into the database", inserted_count)
                 print(f"\nSuccessfully inserted {inserted_count} records into the database.")
             else:
                 logger.info("User chose not to insert data into the database")
@@ -188,7 +213,7 @@ def main():
         logger.info("Pipeline completed successfully")
         
     except Exception as e:
-        logger.error(f"Pipeline failed: {str(e)}")
+        logger.error("Pipeline failed: %s", e)
         raise
     finally:
         if 'db' in locals():
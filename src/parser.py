@@ -1,78 +1,81 @@
-import csv
 import logging
-import io
-from typing import List, Dict, Any, Optional, Union
+import pandas as pd
+from typing import List, Dict, Any, Optional
 
 logger = logging.getLogger(__name__)
 
+# CSV header of each text field and the record key it is stored under
+TEXT_FIELDS = {
+    'Loc': 'loc',
+    'Loc Zone': 'loc_zone',
+    'Loc Name': 'loc_name',
+    'Loc Purpose': 'loc_purpose',
+    'Meas Basis Desc': 'measure_basis',
+}
+
+# Characters removed from numeric values before they are converted
+_NUM_TRANS = str.maketrans('', '', ', \t\r\n')
+
+# CSV header of each numeric field and the record key it is stored under
+NUMERIC_FIELDS = {
+    'Oper Capacity': 'oper_capacity',
+    'Design Capacity': 'design_capacity',
+    'Scheduled Qty': 'scheduled_qty',
+    'Operationally Available': 'operationally_available',
+    'Total Scheduled': 'total_scheduled',
+}
+
 class CSVParser:
-    
+
     def __init__(self):
         pass
-    
-    def parse_csv(self, csv_data: str) -> List[Dict[str, Any]]:
-       
-        logger.info("Parsing CSV data")
-        
-        # Create a CSV reader
-        csv_file = io.StringIO(csv_data)
-        reader = csv.DictReader(csv_file)
-        
-        # Process each row
-        records = []
-        for i, row in enumerate(reader, start=1):
-            try:
-                # Clean and validate the record
-                record = self._clean_record(row)
-                
-                if record:
-                    records.append(record)
-                else:
-                    logger.warning(f"Skipping invalid record at row {i}")
-            except Exception as e:
-                logger.error(f"Error processing row {i}: {str(e)}")
-        
-        logger.info(f"Parsed {len(records)} valid records from CSV")
-        return records
-    
-    def _clean_record(self, row: Dict[str, str]) -> Optional[Dict[str, Any]]:
-        
-        record = {}
-        
-        # Process each field
-        try:
-            # Required fields
-            if not row.get('Loc'):
-                logger.warning("Missing required field: Loc")
-                return None
-            
-            record['loc'] = row.get('Loc', '').strip()
-            record['loc_zone'] = row.get('Loc Zone', '').strip()
-            record['loc_name'] = row.get('Loc Name', '').strip()
-            record['loc_purpose'] = row.get('Loc Purpose', '').strip()
-            record['measure_basis'] = row.get('Meas Basis Desc', '').strip()
-            
-            # Numeric fields
-            record['oper_capacity'] = self._parse_numeric(row.get('Oper Capacity', ''))
-            record['design_capacity'] = self._parse_numeric(row.get('Design Capacity', ''))
-            record['scheduled_qty'] = self._parse_numeric(row.get('Scheduled Qty', ''))
-            record['operationally_available'] = self._parse_numeric(row.get('Operationally Available', ''))
-            record['total_scheduled'] = self._parse_numeric(row.get('Total Scheduled', ''))
-            
-            return record
-        except Exception as e:
-            logger.error(f"Error cleaning record: {str(e)}")
-            return None
-    
-    def _parse_numeric(self, value: str) -> Optional[float]: 
-        if not value or value.strip() == '':
-            return None
-        
-        cleaned_value = value.replace(',', '').strip()
-        
+
+    def parse_csv(self, csv_path: str, gas_day: Optional[str] = None,
+                  cycle: Optional[int] = None) -> Dict[str, List[Any]]:
+
+        # Read every field as a string, empty fields stay empty strings
         try:
-            return float(cleaned_value)
-        except ValueError:
-            logger.warning(f"Could not parse numeric value: {value}")
-            return None
+            df = pd.read_csv(
+                csv_path,
+                dtype=str,
+                encoding_errors='replace',
+                keep_default_na=False,
+                usecols=lambda column: column in TEXT_FIELDS or column in NUMERIC_FIELDS,
+                on_bad_lines='warn'
+            )
+        except pd.errors.EmptyDataError:
+            df = pd.DataFrame()
+
+        # Fields missing from the file are treated as empty
+        df = df.reindex(columns=[*TEXT_FIELDS, *NUMERIC_FIELDS]).fillna('').astype(str)
 
+        # Required fields
+        missing_loc = df['Loc'] == ''
+        if missing_loc.any():
+            logger.warning("Skipping %d records with missing required field: Loc", missing_loc.sum())
+            df = df[~missing_loc]
+
+        # Text fields
+        parsed = pd.DataFrame({key: df[column].str.strip() for column, key in TEXT_FIELDS.items()})
+
+        # Numeric fields, values that are not numbers become None
+        for column, key in NUMERIC_FIELDS.items():
+            values = df[column].str.translate(_NUM_TRANS)
+            numbers = pd.to_numeric(values, errors='coerce').astype(float)
+
+            invalid = numbers.isna() & (values != '')
+            if invalid.any():
+                logger.warning("Could not parse %d numeric values in column: %s", invalid.sum(), column)
+
+            parsed[key] = numbers
+
+        # Stamp the gas day and cycle the file was downloaded for on every record
+        if gas_day is not None:
+            parsed['gas_day'] = gas_day
+        if cycle is not None:
+            parsed['cycle'] = cycle
+
+        records = parsed.astype(object).where(parsed.notna(), None).to_dict(orient='list')
+
+        logger.info("Parsed %d valid records from %s", len(parsed), csv_path)
+        return records